@@ -1,4 +1,4 @@
-from .contagiograms import plot, flipbook
-from .utils import plot_contagiograms
+from .contagiograms import plot, overview, flipbook, preprocess
+from .utils import plot_contagiograms, plot_overview
 from .cli import parse_args
 from .consts import *
\ No newline at end of file
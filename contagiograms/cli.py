@@ -54,6 +54,13 @@ def valid_date(d):
         raise argparse.ArgumentTypeError(f"Invalid date format: '{d}'")
 
 
+def valid_shard(s):
+    match = re.fullmatch("([0-9]+)/([1-9][0-9]*)", s)
+    if match and int(match.group(1)) < int(match.group(2)):
+        return int(match.group(1)), int(match.group(2))
+    raise argparse.ArgumentTypeError(f"Invalid shard: '{s}' (expected i/N with 0 <= i < N)")
+
+
 def parse_args(args):
     parser = get_parser()
 
@@ -86,6 +93,13 @@ def parse_args(args):
         type=valid_date,
     )
 
+    parser.add_argument(
+        "--end_date",
+        help="ending date for the query [defaults to today]",
+        default=None,
+        type=valid_date,
+    )
+
     parser.add_argument(
         "--day-of-the-week",
         "--no-day-of-the-week",
@@ -102,4 +116,36 @@ def parse_args(args):
         action="store_true",
     )
 
-    return parser.parse_args(args)
+    parser.add_argument(
+        "--overview",
+        help="a flag to plot every n-gram of the input file in a single overview figure",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--shard",
+        help="only plot the i-th of N shards of the input file [eg, 0/4, 1/4, 2/4, 3/4]",
+        default=None,
+        type=valid_shard,
+    )
+
+    parser.add_argument(
+        "--merge",
+        help="a flag to combine the outputs of all shards into a flipbook and a run report without plotting",
+        action="store_true",
+    )
+
+    args = parser.parse_args(args)
+
+    if args.end_date is not None and args.end_date < args.start_date:
+        parser.error(
+            f"end date ({args.end_date.date()}) is before start date ({args.start_date.date()})"
+        )
+
+    if args.shard is not None and args.overview:
+        parser.error("--overview plots the whole input in one figure and cannot be sharded")
+
+    if args.shard is not None and args.flipbook:
+        parser.error("--flipbook cannot be combined with --shard; use --merge once all shards are done")
+
+    return args
@@ -7,6 +7,9 @@ types_colors = {
     "OT": "steelblue",
 }
 
+# max number of n-grams kept in the tokenization and display caches
+cache_size = 2**14
+
 fm._rebuild()
 fonts = {
     "Default": fm.FontProperties(family=["sans-serif"]),
@@ -15,19 +15,23 @@ try:
 except ImportError:
     import importlib_resources as pkg_resources
 
+import hashlib
 import logging
+import pickle
 import time
+from functools import lru_cache
 import ujson
 from datetime import datetime
 from PyPDF2 import PdfFileMerger, PdfFileReader
 
+import resources
 from storywrangling import Storywrangler
 from storywrangling.regexr import nparser
 from contagiograms.cli import parse_args
-from contagiograms.utils import plot_contagiograms
-from contagiograms.consts import examples
+from contagiograms.utils import plot_contagiograms, plot_overview, ngram_display
+from contagiograms.consts import examples, cache_size
 
-__all__ = ["plot", "flipbook", ]
+__all__ = ["plot", "overview", "flipbook", "shard", "merge", "preprocess", ]
 
 
 logging.basicConfig(
@@ -37,16 +41,17 @@ logging.basicConfig(
 )
 
 
-def flipbook(savepath, datapath):
+def flipbook(savepath, datapath, files=None):
     """ Combine PDFs into a flipBook
     Args:
         savepath: path to save generated pdf
         datapath: directory containing pdfs to be processed
+        files: an optional list of pdfs to combine instead of every pdf in datapath
     """
     pdf = PdfFileMerger()
     datapath = Path(datapath)
 
-    for f in sorted(datapath.rglob("*.pdf")):
+    for f in sorted(datapath.rglob("*.pdf")) if files is None else files:
         logging.info(f)
         pdf.append(PdfFileReader(str(f), "rb"))
 
@@ -60,10 +65,205 @@ def flipbook(savepath, datapath):
     )
 
 
+def shard(grams, index, total):
+    """ Split figures across shards, balanced by the number of panels per figure
+
+    Args:
+        grams: a dict list of n-grams to parse out
+        index: index of the shard to keep [0, total)
+        total: total number of shards
+
+    Returns:
+        a dict of the figures assigned to the given shard
+    """
+    loads = [0] * total
+    shards = [[] for _ in range(total)]
+
+    # largest figures first, then by key, so every node computes the same split
+    for key in sorted(grams, key=lambda k: (-len(grams[k][:12]), k)):
+        s = loads.index(min(loads))
+        shards[s].append(key)
+        loads[s] += len(grams[key][:12])
+
+    keys = set(shards[index])
+    return {k: grams[k] for k in grams if k in keys}
+
+
+def run_id(grams):
+    """ Identifier of a batch run, shared by all of its shards
+
+    Args:
+        grams: a dict list of n-grams to parse out (before sharding)
+
+    Returns:
+        a short hash of the figure keys
+    """
+    return hashlib.sha1(ujson.dumps(sorted(grams)).encode("utf-8")).hexdigest()[:12]
+
+
+def merge(savepath):
+    """ Combine the outputs of all shards into a single flipbook and a run report
+
+    Args:
+        savepath: directory containing the per-shard manifests and plots
+    """
+    savepath = Path(savepath)
+    runs = {}
+    for f in savepath.glob("manifest_*.json"):
+        with open(f, "r") as data:
+            m = ujson.load(data)
+        runs.setdefault((m.get("run"), m["shards"]), []).append(m)
+
+    if not runs:
+        logging.warning(f"No shard manifests found in {savepath}")
+        return
+
+    if len(runs) > 1:
+        logging.error(
+            f"Found manifests from {len(runs)} different runs in {savepath} "
+            f"(run, shards): {sorted(runs, key=str)}; remove stale manifests before merging"
+        )
+        return
+
+    (run, total), manifests = runs.popitem()
+    manifests = sorted(manifests, key=lambda m: m["shard"])
+    found = {m["shard"] for m in manifests}
+    missing = sorted(set(range(total)) - found)
+    if missing:
+        logging.warning(f"Missing manifests for shards: {missing}")
+
+    figures = {}
+    for m in manifests:
+        figures.update(m["figures"])
+
+    flipbook(
+        savepath=savepath,
+        datapath=savepath,
+        files=[savepath / f"{figures[k]['name']}.pdf" for k in sorted(figures)],
+    )
+
+    report = {
+        "run": run,
+        "shards": total,
+        "missing": missing,
+        "figures": len(figures),
+        "panels": sum(f["panels"] for f in figures.values()),
+        "elapsed": sum(m["elapsed"] for m in manifests),
+        "manifests": manifests,
+    }
+    with open(savepath / f"{datetime.date(datetime.now())}_report_{savepath.stem}.json", "w") as out:
+        ujson.dump(report, out, indent=4, ensure_ascii=False)
+
+    logging.info(
+        f"Saved: {savepath}/{datetime.date(datetime.now())}_report_{savepath.stem}.json"
+    )
+
+
+@lru_cache(maxsize=cache_size)
+def ngram_order(w, parser):
+    """ Number of tokens in an n-gram, memoized across figures
+
+    Args:
+        w: n-gram to parse out
+        parser: a compiled n-gram regex parser
+
+    Returns:
+        the order n of the n-gram
+    """
+    return len(nparser(w, parser=parser, n=1))
+
+
+def language_name(languages, ll):
+    """ Display name of a language code, 'All' for unsupported codes """
+    name = languages.get(ll)
+    return "All" if name is None else name
+
+
+def quoted(w):
+    """ How an n-gram is labelled in figures (and keyed in the display cache) """
+    return f"'{w}'"
+
+
+@lru_cache(maxsize=1)
+def bundled_resources():
+    """ N-gram parser and language table shipped with the package, no database needed """
+    with pkg_resources.open_binary(resources, "ngrams.bin") as f:
+        parser = pickle.load(f)
+    with pkg_resources.open_text(resources, "supported_languages.json") as f:
+        languages = ujson.load(f)
+    return parser, languages
+
+
+def preprocess(grams, storywrangler=None):
+    """ Tokenize and resolve display metadata for every n-gram of an input file in one pass
+
+    The results also warm the caches used by `plot` and `overview`,
+    so each distinct n-gram is only tokenized and bidi-rendered once per process.
+
+    Args:
+        grams: a dict list of n-grams to parse out
+        storywrangler: a Storywrangler instance (uses the bundled parser and language table if not given)
+
+    Returns:
+        a JSON-serializable dict of {language code: {n-gram: metadata}}
+        with the order, language name, display string and font family of each n-gram
+    """
+    if type(grams) != dict:
+        with open(grams, "r") as data:
+            grams = ujson.load(data)
+
+    if storywrangler is None:
+        parser, languages = bundled_resources()
+    else:
+        parser, languages = storywrangler.parser, storywrangler.supported_languages
+
+    meta = {}
+    for listt in grams.values():
+        for w, ll in listt:
+            if w in meta.get(ll, {}):
+                continue
+
+            lang = language_name(languages, ll)
+            display, font = ngram_display(lang, quoted(w))
+            meta.setdefault(ll, {})[w] = dict(
+                order=ngram_order(w, parser),
+                lang=lang,
+                display=display,
+                font=font.get_family(),
+            )
+
+    return meta
+
+
+def query(storywrangler, w, ll, start_date, end_date):
+    """ Query the timeseries of an n-gram along with its language totals
+
+    Args:
+        storywrangler: a Storywrangler instance
+        w: n-gram to query
+        ll: language code
+        start_date: starting date for the query
+        end_date: ending date for the query
+
+    Returns:
+        a dataframe of the n-gram timeseries with its language totals
+    """
+    n = ngram_order(w, storywrangler.parser)
+    d = storywrangler.get_ngram(w, lang=ll, start_time=start_date, end_time=end_date)
+    lang = storywrangler.get_lang(ll, start_time=start_date, end_time=end_date)
+
+    d["lang_num_ngrams"] = lang[f"num_{n}grams"]
+    d["lang_num_ngrams_no_rt"] = lang[f"num_{n}grams_no_rt"]
+
+    d.index.name = f"{language_name(storywrangler.supported_languages, ll)}\n{quoted(w)}"
+    return d
+
+
 def plot(
     grams,
     savepath,
     start_date=datetime(2010, 1, 1),
+    end_date=None,
     t1="1M",
     t2=30,
     day_of_the_week=True
@@ -74,9 +274,13 @@ def plot(
         grams: a dict list of n-grams to parse out
         savepath: path to save generated plot
         start_date: starting date for the query
+        end_date: ending date for the query (defaults to today)
         t1: time scale to investigate relative social amplification [eg, M, 2M, 6M, Y]
         t2: window size for smoothing the main timeseries [days]
         day_of_the_week: a toggle to display r_rel by day of the week
+
+    Returns:
+        a dict of the file name (relative to savepath) and number of panels for each figure
     """
 
     Path(savepath).mkdir(parents=True, exist_ok=True)
@@ -85,44 +289,79 @@ def plot(
         with open(grams, "r") as data:
             grams = ujson.load(data)
 
+    if end_date is None:
+        end_date = datetime.now()
+
+    if end_date < start_date:
+        raise ValueError(f"End date ({end_date.date()}) is before start date ({start_date.date()})")
+
     storywrangler = Storywrangler()
+    figures = {}
 
     for key, listt in grams.items():
         ngrams = []
         for i, (w, ll) in enumerate(listt[:12]):
+            ngrams.append(query(storywrangler, w, ll, start_date, end_date))
 
-            n = len(nparser(w, parser=storywrangler.parser, n=1))
-            d = storywrangler.get_ngram(w, lang=ll, start_time=start_date)
-            lang = storywrangler.get_lang(ll, start_time=start_date)
-
-            d["lang_count"] = lang["count"]
-            d["lang_count_no_rt"] = lang["count_no_rt"]
-
-            d[f"lang_num_ngrams"] = lang[f"num_{n}grams"]
-            d[f"lang_num_ngrams_no_rt"] = lang[f"num_{n}grams_no_rt"]
-
-            d[f"lang_unique_ngrams"] = lang[f"unique_{n}grams"]
-            d[f"lang_unique_ngrams_no_rt"] = lang[f"unique_{n}grams_no_rt"]
-
-            d.index.name = (
-                f"{storywrangler.supported_languages.get(ll)}\n'{w}'"
-                if storywrangler.supported_languages.get(ll) is not None
-                else f"All\n'{w}'"
-            )
-
-            ngrams.append(d)
-
+        path = f"{savepath}/{datetime.date(datetime.now())}_contagiograms_{key}"
         plot_contagiograms(
-            f"{savepath}/{datetime.date(datetime.now())}_contagiograms_{key}",
+            path,
             ngrams,
             t1=t1,
             t2=t2,
             fullpage=True if len(ngrams) > 6 else False,
             day_of_the_week=day_of_the_week,
         )
-        logging.info(
-            f"Saved: {savepath}/{datetime.date(datetime.now())}_contagiograms_{key}"
-        )
+        logging.info(f"Saved: {path}")
+        figures[key] = dict(name=Path(path).name, panels=len(ngrams))
+
+    return figures
+
+
+def overview(
+    grams,
+    savepath,
+    start_date=datetime(2010, 1, 1),
+    end_date=None,
+    t1="1M",
+    t2=30,
+):
+    """ Plot every n-gram of the input in a single high-density overview figure
+
+    Args:
+        grams: a dict list of n-grams to parse out
+        savepath: path to save generated plot
+        start_date: starting date for the query
+        end_date: ending date for the query (defaults to today)
+        t1: time scale to investigate relative social amplification [eg, M, 2M, 6M, Y]
+        t2: window size for smoothing the main timeseries [days]
+
+    Returns:
+        path of the saved plot
+    """
+
+    Path(savepath).mkdir(parents=True, exist_ok=True)
+
+    if type(grams) != dict:
+        with open(grams, "r") as data:
+            grams = ujson.load(data)
+
+    if end_date is None:
+        end_date = datetime.now()
+
+    if end_date < start_date:
+        raise ValueError(f"End date ({end_date.date()}) is before start date ({start_date.date()})")
+
+    storywrangler = Storywrangler()
+
+    # n-grams repeated across figures only get queried and drawn once
+    unique = dict.fromkeys((w, ll) for listt in grams.values() for w, ll in listt)
+    ngrams = [query(storywrangler, w, ll, start_date, end_date) for w, ll in unique]
+
+    path = f"{savepath}/{datetime.date(datetime.now())}_overview"
+    plot_overview(path, ngrams, t1=t1, t2=t2)
+    logging.info(f"Saved: {path}")
+    return path
 
 
 def main(args=None):
@@ -130,15 +369,51 @@ def main(args=None):
 
     args = parse_args(args)
 
-    plot(
-        examples if args.input is None else Path(args.input),
+    if args.merge:
+        merge(savepath=Path(args.output))
+        logging.info(f"Total time elapsed: {time.time() - timeit:.2f} sec.")
+        return
+
+    grams = examples
+    if args.input is not None:
+        with open(args.input, "r") as data:
+            grams = ujson.load(data)
+
+    if args.shard is not None:
+        run = run_id(grams)
+        grams = shard(grams, *args.shard)
+
+    if args.overview:
+        overview(
+            grams,
+            savepath=Path(args.output),
+            start_date=args.start_date,
+            end_date=args.end_date,
+            t1=args.t1,
+            t2=args.t2,
+        )
+        logging.info(f"Total time elapsed: {time.time() - timeit:.2f} sec.")
+        return
+
+    figures = plot(
+        grams,
         savepath=Path(args.output),
         start_date=args.start_date,
+        end_date=args.end_date,
         t1=args.t1,
         t2=args.t2,
         day_of_the_week=args.day_of_the_week
     )
 
+    if args.shard is not None:
+        i, n = args.shard
+        with open(Path(args.output) / f"manifest_{i}-of-{n}.json", "w") as out:
+            ujson.dump(
+                dict(run=run, shard=i, shards=n, elapsed=time.time() - timeit, figures=figures),
+                out, indent=4, ensure_ascii=False,
+            )
+        logging.info(f"Saved: {args.output}/manifest_{i}-of-{n}.json")
+
     if args.flipbook:
         flipbook(
             savepath=Path(args.output),
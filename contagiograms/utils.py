@@ -1,6 +1,7 @@
 
 import logging
 import warnings
+from functools import lru_cache
 import matplotlib.colors as mcolors
 import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
@@ -8,6 +9,7 @@ import matplotlib.ticker as ticker
 import numpy as np
 import pandas as pd
 from bidi import algorithm as bidialg
+from matplotlib.collections import LineCollection
 from matplotlib.lines import Line2D
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 from pandas.plotting import register_matplotlib_converters
@@ -19,6 +21,56 @@ warnings.simplefilter("ignore")
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=consts.cache_size)
+def ngram_display(lang, word):
+    """ Bidi-rendered display string and font of an n-gram, memoized across figures
+
+    Args:
+        lang: language name (eg, 'English', 'Korean')
+        word: n-gram to display
+
+    Returns:
+        a tuple of the display string and its font properties
+    """
+    try:
+        word = bidialg.get_display(word)
+    except UnicodeEncodeError:
+        word = str(word, 'utf-8')
+
+    if not word.isascii() and lang in consts.fonts.keys():
+        prop = consts.fonts.get(lang)
+    else:
+        prop = consts.fonts.get('Default')
+
+    return word, prop
+
+
+def rrel_cmap(vmin=0, vmax=2, vcenter=1, step=.1):
+    """ Diverging colormap for R_rel: greys below the baseline, reds above it """
+    rtcmap = plt.get_cmap('OrRd', 256)
+    otcmap = plt.get_cmap('Greys_r', 256)
+
+    cmap = np.vstack((
+        otcmap(np.linspace(.4, 1-step, int(abs(vcenter - vmin)/step))),
+        [1, 1, 1, 1],
+        rtcmap(np.linspace(0, 1+step, int(abs(vcenter - vmax)/step)))
+    ))
+    return mcolors.ListedColormap(cmap)
+
+
+def relative_amplification(df):
+    """ Daily R_rel: the n-gram's retweet ratio over the language's retweet ratio """
+    rt_ratio = (df['count'] - df['count_no_rt']) / df['count']
+    lang_ratio = (df['lang_num_ngrams'] - df['lang_num_ngrams_no_rt']) / df['lang_num_ngrams']
+    r_rel = rt_ratio / lang_ratio
+    return r_rel.replace([np.inf, -np.inf, np.nan], 1)
+
+
+def smooth(ts, t2):
+    """ Centered rolling mean of a daily timeseries over t2 days """
+    return ts.rolling(t2, center=True).mean()
+
+
 def plot_contagiograms(savepath, ngrams, t1, t2, fullpage, day_of_the_week):
     """ Plot a grid of contagiograms
 
@@ -63,15 +115,7 @@ def plot_contagiograms(savepath, ngrams, t1, t2, fullpage, day_of_the_week):
     days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
     vmin, vmax, vcenter, step = 0, 2, 1, .1
     contagion_color = 'orangered'
-    rtcmap = plt.get_cmap('OrRd', 256)
-    otcmap = plt.get_cmap('Greys_r', 256)
-
-    cmap = np.vstack((
-        otcmap(np.linspace(.4, 1-step, int(abs(vcenter - vmin)/step))),
-        [1, 1, 1, 1],
-        rtcmap(np.linspace(0, 1+step, int(abs(vcenter - vmax)/step)))
-    ))
-    cmap = mcolors.ListedColormap(cmap)
+    cmap = rrel_cmap(vmin, vmax, vcenter, step)
 
     minr, maxr = 1, 10**6
     start_date = ngrams[0].index[0]
@@ -133,30 +177,16 @@ def plot_contagiograms(savepath, ngrams, t1, t2, fullpage, day_of_the_week):
             df['count_no_rt'] = df['count_no_rt'].fillna(0)
 
             df['freq'] = df['freq'].fillna(0)
-            df['freq_no_rt'] = df['freq_no_rt'].fillna(0)
-
             df['rank'] = df['rank'].fillna(maxr)
-            df['rank_no_rt'] = df['rank_no_rt'].fillna(maxr)
 
-            rt_ratio = (df['count'] - df['count_no_rt']) / df['count']
-            lang_ratio = (df['lang_num_ngrams'] - df['lang_num_ngrams_no_rt']) / df['lang_num_ngrams']
-            r_rel = rt_ratio / lang_ratio
-            r_rel = r_rel.replace([np.inf, -np.inf, np.nan], 1)
+            r_rel = relative_amplification(df)
 
             at = df['count'].resample(t1).mean()
             ot = df['count_no_rt'].resample(t1).mean()
             rt = at - ot
 
             lang, word = df.index.name.split('\n')
-            try:
-                word = bidialg.get_display(word)
-            except UnicodeEncodeError:
-                word = str(word, 'utf-8')
-
-            if not word.isascii() and lang in consts.fonts.keys():
-                prop = consts.fonts.get(lang)
-            else:
-                prop = consts.fonts.get('Default')
+            word, prop = ngram_display(lang, word)
 
             cax.text(
                 .5,
@@ -222,7 +252,7 @@ def plot_contagiograms(savepath, ngrams, t1, t2, fullpage, day_of_the_week):
                 )
 
                 ax.plot(
-                    df[metric].rolling(t2, center=True).mean(),
+                    smooth(df[metric], t2),
                     color='k',
                     lw=1,
                 )
@@ -382,3 +412,114 @@ def plot_contagiograms(savepath, ngrams, t1, t2, fullpage, day_of_the_week):
         plt.subplots_adjust(top=0.97, right=0.97, hspace=0.5)
         plt.savefig(f'{savepath}.pdf', bbox_inches='tight', pad_inches=.25)
         plt.savefig(f'{savepath}.png', dpi=300, bbox_inches='tight', pad_inches=.25)
+
+
+def plot_overview(savepath, ngrams, t1, t2):
+    """ Plot many n-grams as compact rows of rank sparklines and R_rel
+
+    Args:
+        savepath: path to save plot
+        ngrams: a list of ngrams to plot
+        t1: time scale to investigate relative social amplification [eg, M, 2M, 6M, Y]
+        t2: window size for smoothing the main timeseries [days]
+    """
+
+    plt.rcParams.update({
+        'font.size': 6,
+        'axes.titlesize': 10,
+        'axes.labelsize': 8,
+        'xtick.labelsize': 8,
+        'ytick.labelsize': 6,
+    })
+    vmin, vmax = 0, 2
+    maxr = 10**6
+    cmap = rrel_cmap(vmin, vmax)
+
+    labels, lines, rrels = [], [], []
+    for df in ngrams:
+        df.index = pd.to_datetime(df.index)
+        df = df.dropna(how='all')
+
+        if df.empty:
+            logger.warning(f'No data for {df.index.name} in the requested window, skipping.')
+            continue
+
+        df['count'] = df['count'].fillna(0)
+        df['count_no_rt'] = df['count_no_rt'].fillna(0)
+        df['rank'] = df['rank'].fillna(maxr)
+
+        lang, word = df.index.name.split('\n')
+        word, prop = ngram_display(lang, word)
+        labels.append((f'{lang} {word}', prop))
+        lines.append(smooth(df['rank'], t2))
+        rrels.append(relative_amplification(df))
+
+    if not lines:
+        logger.warning(f'No data to plot for {savepath}.')
+        return
+
+    # x-range comes from the daily data; resampled labels are period ends
+    start_date = min(r.index[0] for r in lines)
+    end_date = max(r.index[-1] for r in lines)
+    days = pd.date_range(start_date, end_date)
+    # resample every n-gram over the same daily range so all rows share the same bins
+    rrels = [r.reindex(days).resample(t1).mean() for r in rrels]
+    bins = rrels[0].index
+    offset = pd.tseries.frequencies.to_offset(t1)
+    heatmap = np.vstack([r.values for r in rrels])
+
+    # each row spans [i, i+1]; rank 1 sits at the top of the row and rank 10^6 at the bottom
+    segments = [
+        np.column_stack((
+            mdates.date2num(rank.index),
+            i + .05 + .9 * np.log10(rank.clip(1, maxr).values) / np.log10(maxr)
+        ))
+        for i, rank in enumerate(lines)
+    ]
+
+    fig, (ax, heatmapax) = plt.subplots(
+        ncols=2, sharex=True, sharey=True,
+        figsize=(12, max(2, .15 * len(lines))),
+        gridspec_kw=dict(width_ratios=[3, 2], wspace=.02),
+    )
+
+    ax.add_collection(LineCollection(segments, colors='k', linewidths=.5))
+    ax.xaxis_date()
+    ax.set_title(r"$n$-gram rank $r$")
+
+    mesh = heatmapax.imshow(
+        np.ma.masked_invalid(heatmap),
+        aspect='auto',
+        interpolation='nearest',
+        cmap=cmap,
+        vmin=vmin,
+        vmax=vmax,
+        # each cell covers its full resample period, ending at its label
+        extent=(mdates.date2num(bins[0] - offset), mdates.date2num(bins[-1]), len(lines), 0),
+    )
+    heatmapax.xaxis_date()
+    heatmapax.set_title(r"$R^{\mathsf{rel}}_{\tau,t,\ell}$")
+
+    ax.set_xlim(mdates.date2num(start_date), mdates.date2num(end_date))
+    ax.set_ylim(len(lines), 0)
+    ax.set_yticks(np.arange(len(lines)) + .5)
+    ax.set_yticklabels([label for label, _ in labels])
+    for tick, (_, prop) in zip(ax.get_yticklabels(), labels):
+        tick.set_fontproperties(prop)
+        tick.set_fontsize(plt.rcParams['ytick.labelsize'])
+    ax.tick_params(axis='y', which='both', length=0)
+    ax.grid(True, which="major", axis='x', alpha=.3, lw=1, linestyle='-')
+
+    for a in (ax, heatmapax):
+        a.spines['right'].set_visible(False)
+        a.spines['left'].set_visible(False)
+        a.spines['top'].set_visible(False)
+
+    plt.colorbar(mesh, ax=heatmapax, extend='max', ticks=range(vmax+1), fraction=.05, pad=.02)
+
+    # keep the PNG under Agg's 2^16 pixel limit for very tall figures (~1 inch spare for titles and padding)
+    dpi = min(300, int(2**16 / (fig.get_figheight() + 1)))
+
+    plt.savefig(f'{savepath}.pdf', bbox_inches='tight', pad_inches=.25)
+    plt.savefig(f'{savepath}.png', dpi=dpi, bbox_inches='tight', pad_inches=.25)
+    plt.close(fig)
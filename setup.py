@@ -18,7 +18,7 @@ setup(
     author="Thayer Alshaabi",
     author_email="thayer.alshaabi@uvm.edu",
     packages=find_packages(),
-    package_data={'contagiograms': ['resources/*.bin', 'resources/*.csv', 'resources/*.json']},
+    package_data={'resources': ['*.bin', '*.csv', '*.json']},
     python_requires=">=3.6",
     install_requires=libs,
     license="MIT",